@@ -7,8 +7,13 @@ Supports automatic detection and upload of boot2 program, as well as read/write
 import sys
 import os
 import time
+import shlex
 import struct
 import argparse
+import binascii
+import contextlib
+import functools
+import operator
 import serial
 from serial.tools import list_ports
 from typing import Optional, List, Tuple, Union, BinaryIO
@@ -31,6 +36,23 @@ BOOT2_BAUDRATE = 128000  # boot2 baud rate
 FRAME_SIZE = 70          # Command frame total size
 MAX_DATA_SIZE = 64       # Maximum single data length
 
+RESPONSE_TIMEOUT = 0.5   # Default command response timeout (seconds)
+
+_FRAME_HEADER = struct.Struct('>BBHB')  # Header, command, address (big-endian), length
+_READ_LEN = [bytes((n,)) for n in range(MAX_DATA_SIZE + 1)]  # READ data field by chunk size
+
+_HEX_STRIP = str.maketrans('', '', ' \t\r\n_')  # Delimiters dropped from hex strings
+_PRINTABLE = bytes(b if 32 <= b < 127 else ord('.') for b in range(256))  # Hex dump ASCII column
+
+# RTS|DTR modem-line mask for setting both reset pins at once (POSIX only)
+try:
+    import fcntl
+    import termios
+    _TIOCM_RTS_DTR = struct.pack('I', termios.TIOCM_RTS | termios.TIOCM_DTR)
+    _TIOCMBIS, _TIOCMBIC = termios.TIOCMBIS, termios.TIOCMBIC
+except (ImportError, AttributeError):
+    _TIOCM_RTS_DTR = None
+
 class STM8BootloaderError(Exception):
     """STM8 Bootloader base exception class"""
     pass
@@ -53,6 +75,10 @@ class STM8Bootloader:
             raise ValueError("reset_pin must be 'rts+dtr', 'rts', 'dtr' or 'none'")
         self.serial = None
         self.in_boot2 = False
+        self._needs_flush = True  # Clear RX before the next command
+
+        # Command frame buffer, reused for every frame sent
+        self._frame_buf = bytearray(FRAME_SIZE)
         self.script_dir = os.path.dirname(os.path.abspath(__file__))
 
         # Store boot2 file path
@@ -73,7 +99,7 @@ class STM8Bootloader:
         print(prefix)
 
     def open(self, baudrate: int = BOOT2_BAUDRATE):
-        """Open serial connection"""
+        """Open serial connection, or switch the baud rate if already open"""
         if self.serial is None or not self.serial.is_open:
             self.serial = serial.Serial(
                 port=self.port,
@@ -81,16 +107,62 @@ class STM8Bootloader:
                 bytesize=serial.EIGHTBITS,
                 parity=serial.PARITY_NONE,
                 stopbits=serial.STOPBITS_ONE,
-                timeout=0  # Set to 0, non-blocking mode
+                xonxoff=False,  # No flow control, RTS/DTR drive MCU reset
+                rtscts=False,
+                dsrdtr=False,
+                timeout=RESPONSE_TIMEOUT  # Blocking reads, bounded by the response timeout
             )
+            self._needs_flush = True
             self.log(f"Serial port {self.port} opened, baud rate {baudrate}", "DEBUG")
 
+            # USB-serial drivers (e.g. FTDI) batch RX for up to 16ms unless low latency is set
+            if hasattr(self.serial, 'set_low_latency_mode'):
+                try:
+                    self.serial.set_low_latency_mode(True)
+                except (NotImplementedError, ValueError) as e:
+                    self.log(f"Low latency mode not available: {e}", "DEBUG")
+        elif self.serial.baudrate != baudrate:
+            # Reconfigure the open port in place instead of closing/reopening the device
+            self.serial.baudrate = baudrate
+            self._needs_flush = True
+            self.log(f"Serial port {self.port} baud rate changed to {baudrate}", "DEBUG")
+
     def close(self):
         """Close serial connection"""
         if self.serial and self.serial.is_open:
             self.serial.close()
             self.log("Serial port closed", "DEBUG")
 
+    def __enter__(self):
+        """Use the bootloader as a context manager that closes the port on exit"""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close serial connection when leaving the with-block"""
+        self.close()
+
+    @contextlib.contextmanager
+    def _serial_timeout(self, timeout: Optional[float]):
+        """Temporarily change the serial read timeout"""
+        old_timeout = self.serial.timeout
+        self.serial.timeout = timeout
+        try:
+            yield
+        finally:
+            self.serial.timeout = old_timeout
+
+    def _set_reset_pins(self, level: bool):
+        """Drive the configured reset pin(s), both lines in a single ioctl where possible"""
+        if self.reset_pin == 'rts+dtr' and _TIOCM_RTS_DTR is not None:
+            request = _TIOCMBIS if level else _TIOCMBIC
+            fcntl.ioctl(self.serial.fileno(), request, _TIOCM_RTS_DTR)
+            return
+
+        if 'rts' in self.reset_pin:
+            self.serial.setRTS(level)
+        if 'dtr' in self.reset_pin:
+            self.serial.setDTR(level)
+
     def reset_mcu(self) -> bool:
         """
         Reset MCU via RTS and/or DTR
@@ -110,29 +182,18 @@ class STM8Bootloader:
         try:
             # Reset sequence: True -> False -> True -> wait 150ms -> False
             # Apply to selected pin(s)
-            if 'rts' in self.reset_pin:
-                self.serial.setRTS(True)
-            if 'dtr' in self.reset_pin:
-                self.serial.setDTR(True)
-            time.sleep(0.01)  # Wait 10ms for stability
-
-            if 'rts' in self.reset_pin:
-                self.serial.setRTS(False)
-            if 'dtr' in self.reset_pin:
-                self.serial.setDTR(False)
-            time.sleep(0.01)  # Wait 10ms for stability
-
-            if 'rts' in self.reset_pin:
-                self.serial.setRTS(True)
-            if 'dtr' in self.reset_pin:
-                self.serial.setDTR(True)
+            self._set_reset_pins(True)
+            time.sleep(0.002)  # Wait 2ms for stability
+
+            self._set_reset_pins(False)
+            time.sleep(0.002)  # Wait 2ms for stability
+
+            self._set_reset_pins(True)
             time.sleep(0.15)  # Wait 150ms for MCU reset
 
-            if 'rts' in self.reset_pin:
-                self.serial.setRTS(False)
-            if 'dtr' in self.reset_pin:
-                self.serial.setDTR(False)
+            self._set_reset_pins(False)
 
+            self._needs_flush = True
             self.log("MCU reset completed", "DEBUG")
             return True
 
@@ -159,25 +220,15 @@ class STM8Bootloader:
         self.serial.reset_input_buffer()
 
         try:
-            # Continuous reading, wait up to 250ms
-            start_time = time.time()
-            buffer = bytearray()
-
-            while time.time() - start_time < 0.25:  # 250ms timeout
-                # Read all available data
-                if self.serial.in_waiting > 0:
-                    data = self.serial.read(self.serial.in_waiting)
-                    buffer.extend(data)
+            # Blocking read until 0x00 0x0D arrives, wait up to 250ms
+            with self._serial_timeout(0.25):
+                buffer = self.serial.read_until(b'\x00\x0d', 256)
 
-                    # Check for 0x00 0x0D
-                    if len(buffer) >= 2 and buffer[-2:] == b'\x00\x0d':
-                        self.log("Received boot1 handshake signal: 0x00 0x0D", "DEBUG")
+            if buffer.endswith(b'\x00\x0d'):
+                self.log("Received boot1 handshake signal: 0x00 0x0D", "DEBUG")
 
-                        # Immediately send boot2.bin
-                        return self.send_boot2_binary(bin_file)
-
-                # Short delay to avoid high CPU usage
-                time.sleep(0.001)  # 1ms
+                # Immediately send boot2.bin
+                return self.send_boot2_binary(bin_file)
 
             # Timeout, no signal received
             self.log("No boot1 signal received within 200ms", "DEBUG")
@@ -201,20 +252,23 @@ class STM8Bootloader:
         self.serial.reset_input_buffer()
 
         try:
-            while True:
-                # Check if there's data
-                if self.serial.in_waiting > 0:
-                    data = self.serial.read(self.serial.in_waiting)
+            # Block in the kernel until data arrives, waking every 100ms so Ctrl+C is handled
+            with self._serial_timeout(0.1):
+                # Last byte of the previous read, so a signal split across reads is still seen
+                tail = b''
+                while True:
+                    data = tail + self.serial.read(max(1, self.serial.in_waiting))
 
                     # Simple check: if data contains 0x00 0x0D
                     if b'\x00\x0d' in data:
-                        self.log("Received boot1 handshake signal: 0x00 0x0D", "INFO")
+                        break
+
+                    tail = data[-1:]
 
-                        # Immediately send boot2.bin
-                        return self.send_boot2_binary(bin_file)
+            self.log("Received boot1 handshake signal: 0x00 0x0D", "INFO")
 
-                # Short delay
-                time.sleep(0.001)
+            # Immediately send boot2.bin
+            return self.send_boot2_binary(bin_file)
 
         except KeyboardInterrupt:
             self.log("User interrupted wait", "INFO")
@@ -253,8 +307,8 @@ class STM8Bootloader:
 
             self.log(f"Read {len(data)} bytes of boot2 program from {bin_file}", "DEBUG")
 
-            # Byte reversal
-            reversed_data = bytes(reversed(data))
+            # Byte reversal (slice runs in C, no per-byte iterator)
+            reversed_data = data[::-1]
 
             # Send data (no checksum added)
             self.serial.write(reversed_data)
@@ -283,10 +337,7 @@ class STM8Bootloader:
 
     def calculate_checksum(self, data: bytes) -> int:
         """Calculate XOR checksum"""
-        checksum = 0
-        for byte in data:
-            checksum ^= byte
-        return checksum
+        return functools.reduce(operator.xor, data, 0)
 
     def create_command_frame(self, cmd: int, addr: int, data: bytes = b'') -> bytes:
         """
@@ -303,23 +354,16 @@ class STM8Bootloader:
         if len(data) > MAX_DATA_SIZE:
             raise STM8BootloaderError(f"Data length exceeds {MAX_DATA_SIZE} byte limit")
 
-        # Build frame
-        frame = bytearray(FRAME_SIZE)
-        frame[0] = CMD_HEADER                    # Frame header
-        frame[1] = cmd                          # Command type
-        frame[2] = (addr >> 8) & 0xFF          # Address high byte
-        frame[3] = addr & 0xFF                  # Address low byte
-        frame[4] = len(data)                    # Data length
-
-        # Fill data
-        if data:
-            frame[5:5+len(data)] = data
+        # Header, command, address (big-endian), length
+        frame = self._frame_buf
+        size = len(data)
+        _FRAME_HEADER.pack_into(frame, 0, CMD_HEADER, cmd, addr, size)
+        frame[5:5+size] = data
 
         # Calculate checksum (from frame header to data end)
-        checksum_data = frame[:5+len(data)]
-        frame[5+len(data)] = self.calculate_checksum(checksum_data)
+        frame[5+size] = self.calculate_checksum(memoryview(frame)[:5+size])
 
-        return bytes(frame[:5+len(data)+1])
+        return bytes(frame[:5+size+1])
 
     def parse_response_frame(self, frame: bytes) -> Tuple[int, int, bytes]:
         """
@@ -334,20 +378,18 @@ class STM8Bootloader:
         if len(frame) < 6:
             raise STM8BootloaderError("Response frame length insufficient")
 
-        if frame[0] != ACK_HEADER:
-            raise STM8BootloaderError(f"Invalid response frame header: 0x{frame[0]:02X}")
+        header, cmd, addr, data_len = _FRAME_HEADER.unpack_from(frame)
+
+        if header != ACK_HEADER:
+            raise STM8BootloaderError(f"Invalid response frame header: 0x{header:02X}")
 
         # Verify checksum
         received_checksum = frame[-1]
-        calculated_checksum = self.calculate_checksum(frame[:-1])
+        calculated_checksum = self.calculate_checksum(memoryview(frame)[:-1])
 
         if received_checksum != calculated_checksum:
             raise STM8BootloaderError(f"Checksum error: received 0x{received_checksum:02X}, calculated 0x{calculated_checksum:02X}")
 
-        cmd = frame[1]
-        addr = (frame[2] << 8) | frame[3]
-        data_len = frame[4]
-
         if len(frame) < 5 + data_len + 1:
             raise STM8BootloaderError("Response frame data length mismatch")
 
@@ -366,20 +408,15 @@ class STM8Bootloader:
         Returns:
             Read data
         """
-        data = bytearray()
-        start_time = time.time()
-
-        while len(data) < size and time.time() - start_time < timeout:
-            if self.serial.in_waiting > 0:
-                chunk = self.serial.read(min(self.serial.in_waiting, size - len(data)))
-                data.extend(chunk)
-            else:
-                time.sleep(0.001)  # Short sleep to avoid high CPU usage
+        # Changing the timeout reconfigures the port, so only do it when needed
+        if self.serial.timeout != timeout:
+            self.serial.timeout = timeout
 
-        return bytes(data)
+        # Single blocking read, returns as soon as size bytes arrived or on timeout
+        return self.serial.read(size)
 
     def send_command(self, cmd: int, addr: int, data: bytes = b'', 
-                    wait_response: bool = True, timeout: float = 0.5) -> Optional[Tuple[int, int, bytes]]:
+                    wait_response: bool = True, timeout: float = RESPONSE_TIMEOUT) -> Optional[Tuple[int, int, bytes]]:
         """
         Send command and receive response
 
@@ -388,7 +425,7 @@ class STM8Bootloader:
             addr: Target address
             data: Data content
             wait_response: Whether to wait for response
-            timeout: Timeout time
+            timeout: Timeout for the whole response frame (seconds)
 
         Returns:
             Parsed response frame, or None
@@ -396,24 +433,38 @@ class STM8Bootloader:
         if not self.serial or not self.serial.is_open:
             raise STM8BootloaderError("Serial port not open")
 
-        # Clear input buffer
-        self.serial.reset_input_buffer()
+        # Clear input buffer only when stale data may be pending
+        if self._needs_flush:
+            self.serial.reset_input_buffer()
+            self._needs_flush = False
 
-        # Create and send command frame
+        # Create and send command frame. Until its response has been read and
+        # parsed the line state is unknown, so any other way out of here
+        # (error, Ctrl+C) leaves the flag set and the next command flushes
         frame = self.create_command_frame(cmd, addr, data)
+        self._needs_flush = True
+        self.serial.write(frame)
 
-        # Log sent frame in hex format
+        # Log sent frame in hex format while the UART drains
         if self.verbose:
-            self.log(f"Sending command frame (hex): {frame.hex()}", "DEBUG")
+            self.log(f"Sent command frame (hex): {frame.hex()}", "DEBUG")
 
-        self.serial.write(frame)
         self.serial.flush()
 
         if not wait_response:
+            # Whatever runs next may talk on the line, keep the flag set
             return None
 
-        # Wait for response
-        response = self.read_with_timeout(FRAME_SIZE, timeout)
+        # Wait for the 5-byte response header, then read exactly the data
+        # length it announces plus the checksum, so short and error responses
+        # return as soon as they are complete. Both reads share one deadline,
+        # timeout bounds the whole response
+        deadline = time.monotonic() + timeout
+        response = self.read_with_timeout(5, timeout)
+        if len(response) == 5 and response[0] == ACK_HEADER:
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                response += self.read_with_timeout(response[4] + 1, remaining)
 
         if not response:
             raise STM8BootloaderError("No response received")
@@ -422,7 +473,9 @@ class STM8Bootloader:
         if self.verbose:
             self.log(f"Received response (hex): {response.hex()}", "DEBUG")
 
-        return self.parse_response_frame(response)
+        result = self.parse_response_frame(response)
+        self._needs_flush = False
+        return result
 
     def check_boot2(self) -> bool:
         """
@@ -434,7 +487,7 @@ class STM8Bootloader:
         try:
             self.log("Checking if in boot2...", "DEBUG")
             # Send read command, data field is length to read (8 bytes)
-            response = self.send_command(CMD_READ, HANDSHAKE_ADDR, b'\x08', timeout=0.5)
+            response = self.send_command(CMD_READ, HANDSHAKE_ADDR, b'\x08', timeout=RESPONSE_TIMEOUT)
 
             if response:
                 cmd, addr, data = response
@@ -472,7 +525,6 @@ class STM8Bootloader:
         self.log("Starting boot2 program upload...", "INFO")
 
         # 1. Switch to 9600 bps
-        self.close()
         self.open(baudrate=BOOT1_BAUDRATE)
         time.sleep(0.05)  # Wait for serial port stabilization
 
@@ -508,7 +560,6 @@ class STM8Bootloader:
 
         # 5. Switch to 128000 bps and check if in boot2
         self.log("Verifying boot2 program...", "INFO")
-        self.close()
         self.open(baudrate=BOOT2_BAUDRATE)
         time.sleep(0.05)  # Extra 50ms wait for stabilization
 
@@ -519,6 +570,12 @@ class STM8Bootloader:
             self.log("boot2 upload verification failed", "ERROR")
             return False
 
+    @staticmethod
+    def _check_span(addr: int, size: int):
+        """Reject transfers that start or end outside the 16-bit address space, before any frame is sent"""
+        if not 0 <= addr <= 0xFFFF or addr + size > 0x10000:
+            raise STM8BootloaderError(f"Address out of range: {hex(addr)} + {size} bytes")
+
     def read_memory(self, addr: int, size: int) -> bytes:
         """
         Read memory
@@ -533,17 +590,23 @@ class STM8Bootloader:
         if not self.in_boot2:
             raise STM8BootloaderError("Not in boot2 mode")
 
+        self._check_span(addr, size)
+
         result = bytearray()
         remaining = size
         current_addr = addr
 
+        # Bind loop invariants to locals once
+        send_command = self.send_command
+        read_len = _READ_LEN
+        verbose = self.verbose
+
         while remaining > 0:
             chunk_size = min(remaining, MAX_DATA_SIZE)
 
             try:
                 # Send read command, data field is length to read
-                response = self.send_command(CMD_READ, current_addr, 
-                                           struct.pack('B', chunk_size))
+                response = send_command(CMD_READ, current_addr, read_len[chunk_size])
 
                 if not response:
                     raise STM8BootloaderError(f"Read address 0x{current_addr:04X} failed")
@@ -560,9 +623,12 @@ class STM8Bootloader:
                 remaining -= chunk_size
                 current_addr += chunk_size
 
-                self.log(f"Read 0x{current_addr-chunk_size:04X} - 0x{current_addr-1:04X} ({chunk_size} bytes)", "DEBUG")
+                if verbose:
+                    self.log(f"Read 0x{current_addr-chunk_size:04X} - 0x{current_addr-1:04X} ({chunk_size} bytes)", "DEBUG")
 
             except Exception as e:
+                # A mismatched response means the line is out of step
+                self._needs_flush = True
                 raise STM8BootloaderError(f"Error during read: {e}")
 
         return bytes(result)
@@ -581,16 +647,23 @@ class STM8Bootloader:
         if not self.in_boot2:
             raise STM8BootloaderError("Not in boot2 mode")
 
+        self._check_span(addr, len(data))
+
         remaining = len(data)
         current_addr = addr
         offset = 0
+        view = memoryview(data)  # Zero-copy chunk slicing
+
+        # Bind loop invariants to locals once
+        send_command = self.send_command
+        verbose = self.verbose
 
         while remaining > 0:
             chunk_size = min(remaining, MAX_DATA_SIZE)
-            chunk_data = data[offset:offset+chunk_size]
+            chunk_data = view[offset:offset+chunk_size]
 
             try:
-                response = self.send_command(CMD_WRITE, current_addr, chunk_data)
+                response = send_command(CMD_WRITE, current_addr, chunk_data)
 
                 if not response:
                     raise STM8BootloaderError(f"Write address 0x{current_addr:04X} failed")
@@ -600,13 +673,16 @@ class STM8Bootloader:
                 if cmd != CMD_WRITE or resp_addr != current_addr:
                     raise STM8BootloaderError(f"Write response mismatch")
 
-                self.log(f"Written 0x{current_addr:04X} - 0x{current_addr+chunk_size-1:04X} ({chunk_size} bytes)", "DEBUG")
+                if verbose:
+                    self.log(f"Written 0x{current_addr:04X} - 0x{current_addr+chunk_size-1:04X} ({chunk_size} bytes)", "DEBUG")
 
                 remaining -= chunk_size
                 current_addr += chunk_size
                 offset += chunk_size
 
             except Exception as e:
+                # A mismatched response means the line is out of step
+                self._needs_flush = True
                 raise STM8BootloaderError(f"Error during write: {e}")
 
         return True
@@ -759,157 +835,199 @@ class STM8Bootloader:
         self.log("\n=== STM8 Bootloader Interactive Mode ===", "INFO")
         self.log("Available commands: read, write, exec, go, info, ls, reload, help, exit", "INFO")
         self.log("Type 'help' for detailed usage\n", "INFO")
+        self._setup_line_editing()
 
+        commands = self._COMMANDS
         while True:
             try:
                 cmd_input = input("stm8loader> ").strip()
                 if not cmd_input:
                     continue
 
-                args = cmd_input.split()
+                # Only pay for shlex when the line actually quotes something
+                if '"' in cmd_input or "'" in cmd_input:
+                    args = shlex.split(cmd_input)
+                else:
+                    args = cmd_input.split()
                 cmd = args[0].lower()
 
                 if cmd == 'exit' or cmd == 'quit':
                     self.log("Exiting interactive mode", "INFO")
                     break
 
-                elif cmd == 'help':
-                    self.show_help()
-
-                elif cmd == 'ls':
-                    # List directory
-                    path = "." if len(args) < 2 else args[1]
-                    self.list_directory(path)
-
-                elif cmd == 'reload':
-                    # Reset and upload boot2 with optional file path
-                    boot2_file = args[1] if len(args) > 1 else None
-                    self.log("Executing reset and to upload boot2...", "INFO")
-                    if not self.upload_boot2(boot2_file):
-                        self.log("Reset upload failed", "ERROR")
-                    else:
-                        self.log("Reset upload successful", "INFO")
-
-                elif cmd == 'info':
-                    try:
-                        info = self.get_info()
-                        self.log("MCU Information:", "INFO")
-                        self.log(f"  Boot0 start address: 0x{info['boot0_address']:04X}", "INFO")
-                        self.log(f"  Main program start address: 0x{info['main_program_address']:04X}", "INFO")
-                        self.log(f"  Raw data: {info['raw_data']}", "INFO")
-                        self.log(f"  Current mode: {'boot2' if info['in_boot2'] else 'unknown'}", "INFO")
-                    except Exception as e:
-                        self.log(f"Error: {e}", "ERROR")
-
-                elif cmd == 'read' or cmd == 'r':
-                    if len(args) < 3:
-                        self.log("Usage: read <addr> <size> [file]", "ERROR")
-                        continue
-
-                    try:
-                        addr = int(args[1], 0)
-                        size = int(args[2], 0)
-
-                        data = self.read_memory(addr, size)
-
-                        # Display data
-                        self.print_hex_dump(addr, data)
-
-                        # Save to file (if specified)
-                        if len(args) >= 4:
-                            filename = args[3]
-                            with open(filename, 'wb') as f:
-                                f.write(data)
-                            self.log(f"Data saved to {filename}", "INFO")
-
-                    except Exception as e:
-                        self.log(f"Error: {e}", "ERROR")
-
-                elif cmd == 'write' or cmd == 'w':
-                    if len(args) < 3:
-                        self.log("Usage: write <addr> <file/hex_string>", "ERROR")
-                        self.log("Example: write 0x8000 firmware.bin", "INFO")
-                        self.log("Example: write 0x8000 AABBCCDDEEFF", "INFO")
-                        continue
-
-                    try:
-                        addr = int(args[1], 0)
-                        source = args[2]
-
-                        # Determine if it's a file or hex string
-                        if os.path.exists(source):
-                            # Read from file
-                            with open(source, 'rb') as f:
-                                data = f.read()
-                        else:
-                            # Try to parse as hex string
-                            source = source.replace('0x', '').replace(' ', '')
-                            if len(source) % 2 != 0:
-                                raise ValueError("Hex string length must be even")
-                            data = bytes.fromhex(source)
-
-                        if self.write_memory(addr, data):
-                            self.log(f"Write successful: {len(data)} bytes to 0x{addr:04X}", "INFO")
-
-                    except Exception as e:
-                        self.log(f"Error: {e}", "ERROR")
-
-                elif cmd == 'exec' or cmd == 'x':
-                    if len(args) < 2:
-                        self.log("Usage: exec <hex_string>", "ERROR")
-                        self.log("Example: exec 4F9D (CLR A; NOP)", "INFO")
-                        continue
-
-                    try:
-                        addr = 0 # run in #boot2.rx_buffer
-                        hex_str = args[1]
-
-                        # Parse hex string
-                        hex_str = hex_str.replace('0x', '').replace(' ', '')
-                        if len(hex_str) % 2 != 0:
-                            raise ValueError("Hex string length must be even")
-                        machine_code = bytes.fromhex(hex_str)
-
-                        if len(machine_code) > MAX_DATA_SIZE:
-                            self.log(f"Error: Machine code too long (max {MAX_DATA_SIZE} bytes)", "ERROR")
-                            continue
-
-                        if self.exec_machine_code(addr, machine_code):
-                            self.log(f"Execute command sent: {len(machine_code)} bytes at 0x{addr:04X}", "INFO")
-
-                    except Exception as e:
-                        self.log(f"Error: {e}", "ERROR")
-
-                elif cmd == 'go' or cmd == 'g':
-                    if len(args) < 2:
-                        self.log("Usage: go <addr>", "ERROR")
-                        continue
-
-                    try:
-                        addr = int(args[1], 0)
-                        if self.go_execute(addr):
-                            self.log(f"Sent jump to 0x{addr:04X} command", "INFO")
-                    except Exception as e:
-                        self.log(f"Error: {e}", "ERROR")
-
-                else:
+                handler = commands.get(cmd)
+                if handler is None:
                     self.log(f"Unknown command: {cmd}", "ERROR")
                     self.log("Type 'help' for available commands", "INFO")
+                else:
+                    handler(self, args)
 
             except KeyboardInterrupt:
                 self.log("\nExiting interactive mode", "INFO")
                 break
+            except EOFError:
+                # End of piped/redirected input, or Ctrl+D
+                self.log("\nExiting interactive mode", "INFO")
+                break
             except Exception as e:
                 self.log(f"Error: {e}", "ERROR")
 
+    def _cmd_help(self, args: List[str]):
+        """Interactive 'help' command"""
+        self.show_help()
+
+    def _cmd_ls(self, args: List[str]):
+        """Interactive 'ls' command: list a directory"""
+        path = "." if len(args) < 2 else args[1]
+        self.list_directory(path)
+
+    def _cmd_reload(self, args: List[str]):
+        """Interactive 'reload' command: reset and upload boot2, optionally from a given file"""
+        boot2_file = args[1] if len(args) > 1 else None
+        self.log("Executing reset and to upload boot2...", "INFO")
+        if not self.upload_boot2(boot2_file):
+            self.log("Reset upload failed", "ERROR")
+        else:
+            self.log("Reset upload successful", "INFO")
+
+    def _cmd_info(self, args: List[str]):
+        """Interactive 'info' command"""
+        try:
+            info = self.get_info()
+            self.log("MCU Information:", "INFO")
+            self.log(f"  Boot0 start address: 0x{info['boot0_address']:04X}", "INFO")
+            self.log(f"  Main program start address: 0x{info['main_program_address']:04X}", "INFO")
+            self.log(f"  Raw data: {info['raw_data']}", "INFO")
+            self.log(f"  Current mode: {'boot2' if info['in_boot2'] else 'unknown'}", "INFO")
+        except Exception as e:
+            self.log(f"Error: {e}", "ERROR")
+
+    def _cmd_read(self, args: List[str]):
+        """Interactive 'read' command"""
+        if len(args) < 3:
+            self.log("Usage: read <addr> <size> [file]", "ERROR")
+            return
+
+        try:
+            addr = _parse_addr(args[1])
+            size = int(args[2], 0)
+
+            data = self.read_memory(addr, size)
+
+            # Display data
+            self.print_hex_dump(addr, data)
+
+            # Save to file (if specified)
+            if len(args) >= 4:
+                filename = args[3]
+                with open(filename, 'wb') as f:
+                    f.write(data)
+                self.log(f"Data saved to {filename}", "INFO")
+
+        except Exception as e:
+            self.log(f"Error: {e}", "ERROR")
+
+    def _cmd_write(self, args: List[str]):
+        """Interactive 'write' command"""
+        if len(args) < 3:
+            self.log("Usage: write <addr> <file/hex_string>", "ERROR")
+            self.log("Example: write 0x8000 firmware.bin", "INFO")
+            self.log("Example: write 0x8000 AABBCCDDEEFF", "INFO")
+            return
+
+        try:
+            addr = _parse_addr(args[1])
+            source = args[2]
+
+            data = _load_write_source(source)
+            if self.write_memory(addr, data):
+                self.log(f"Write successful: {len(data)} bytes to 0x{addr:04X}", "INFO")
+
+        except Exception as e:
+            self.log(f"Error: {e}", "ERROR")
+
+    def _cmd_exec(self, args: List[str]):
+        """Interactive 'exec' command"""
+        if len(args) < 2:
+            self.log("Usage: exec <hex_string>", "ERROR")
+            self.log("Example: exec 4F9D (CLR A; NOP)", "INFO")
+            return
+
+        try:
+            addr = 0 # run in #boot2.rx_buffer
+
+            # Parse hex string
+            machine_code = _parse_hex(args[1])
+
+            if len(machine_code) > MAX_DATA_SIZE:
+                self.log(f"Error: Machine code too long (max {MAX_DATA_SIZE} bytes)", "ERROR")
+                return
+
+            if self.exec_machine_code(addr, machine_code):
+                self.log(f"Execute command sent: {len(machine_code)} bytes at 0x{addr:04X}", "INFO")
+
+        except Exception as e:
+            self.log(f"Error: {e}", "ERROR")
+
+    def _cmd_go(self, args: List[str]):
+        """Interactive 'go' command"""
+        if len(args) < 2:
+            self.log("Usage: go <addr>", "ERROR")
+            return
+
+        try:
+            addr = _parse_addr(args[1])
+            if self.go_execute(addr):
+                self.log(f"Sent jump to 0x{addr:04X} command", "INFO")
+        except Exception as e:
+            self.log(f"Error: {e}", "ERROR")
+
+    # Interactive command dispatch table, built once with the class
+    _COMMANDS = {
+        'help': _cmd_help,
+        'ls': _cmd_ls,
+        'reload': _cmd_reload,
+        'info': _cmd_info,
+        'read': _cmd_read, 'r': _cmd_read,
+        'write': _cmd_write, 'w': _cmd_write,
+        'exec': _cmd_exec, 'x': _cmd_exec,
+        'go': _cmd_go, 'g': _cmd_go,
+    }
+
+    def _setup_line_editing(self):
+        """Enable input() history and command-name tab completion if readline is available"""
+        try:
+            import readline
+        except ImportError:
+            return
+
+        commands = sorted(list(self._COMMANDS) + ['exit', 'quit'])
+
+        def complete(text, state):
+            # Only complete the command word, arguments are addresses/paths
+            if readline.get_begidx() > 0:
+                return None
+            matches = [c for c in commands if c.startswith(text)]
+            return matches[state] if state < len(matches) else None
+
+        readline.set_completer(complete)
+        if 'libedit' in (readline.__doc__ or ''):
+            readline.parse_and_bind('bind ^I rl_complete')
+        else:
+            readline.parse_and_bind('tab: complete')
+
     def print_hex_dump(self, start_addr: int, data: bytes, bytes_per_line: int = 16):
         """Print data in hexdump format"""
+        lines = []
         for i in range(0, len(data), bytes_per_line):
             chunk = data[i:i+bytes_per_line]
-            hex_str = ' '.join(f'{b:02X}' for b in chunk)
-            ascii_str = ''.join(chr(b) if 32 <= b < 127 else '.' for b in chunk)
+            hex_str = binascii.hexlify(chunk, ' ').decode('ascii').upper()
+            ascii_str = chunk.translate(_PRINTABLE).decode('ascii')
             addr = start_addr + i
-            print(f"{addr:04X}: {hex_str:<48} {ascii_str}")
+            lines.append(f"{addr:04X}: {hex_str:<48} {ascii_str}\n")
+
+        # Emit the whole dump with a single write
+        sys.stdout.write(''.join(lines))
 
     @staticmethod
     def show_help():
@@ -942,6 +1060,38 @@ Command List:
         print(help_text)
 
 
+def _parse_hex(text: str) -> bytes:
+    """Parse a hex string argument such as '0x4F 0x9D' or 'AA_BB'"""
+    hex_str = text.translate(_HEX_STRIP).replace('0x', '').replace('0X', '')
+    if len(hex_str) & 1:
+        raise ValueError("Hex string length must be even")
+    return bytes.fromhex(hex_str)
+
+
+def _load_write_source(source: str) -> bytes:
+    """
+    Resolve a write command's FILE/HEX argument
+
+    Args:
+        source: File path or hex string
+
+    Returns:
+        File contents, or the parsed hex bytes
+    """
+    try:
+        f = open(source, 'rb')
+    except OSError:
+        # Keep the real error for files that exist but cannot be opened
+        if os.path.exists(source):
+            raise
+        # Try to parse as hex string
+        return _parse_hex(source)
+
+    # Read from file, this also covers pipes, FIFOs and empty files
+    with f:
+        return f.read()
+
+
 def list_serial_ports():
     """List available serial ports"""
     ports = list_ports.comports()
@@ -954,7 +1104,83 @@ def list_serial_ports():
         print(f"  {i+1}. {port.device} - {port.description}")
 
 
-def main():
+def _check_addr(addr: int) -> int:
+    """Reject addresses outside the 16-bit STM8 address space"""
+    if not 0 <= addr <= 0xFFFF:
+        raise ValueError(f"Address out of range: {hex(addr)}")
+    return addr
+
+
+def _parse_addr(text: str) -> int:
+    """Parse an address argument (decimal, 0x hex, 0o, 0b)"""
+    return _check_addr(int(text, 0))
+
+
+def _int_arg(text: str) -> int:
+    """argparse type for addresses and sizes (decimal, 0x hex, 0o, 0b)"""
+    try:
+        return int(text, 0)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid number: '{text}'")
+
+
+def _addr_arg(text: str) -> int:
+    """argparse type for addresses"""
+    addr = _int_arg(text)
+    try:
+        return _check_addr(addr)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _hex_arg(text: str) -> bytes:
+    """argparse type for hex string arguments"""
+    try:
+        return _parse_hex(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"invalid hex string '{text}': {e}")
+
+
+def _run_read(loader: STM8Bootloader, args: argparse.Namespace):
+    """--read: dump memory, optionally saving it to --output"""
+    addr, size = args.read
+    data = loader.read_memory(addr, size)
+
+    # Print data
+    loader.print_hex_dump(addr, data)
+
+    # Save to file (if specified)
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(data)
+        print(f"[INFO] Data saved to {args.output}")
+
+
+def _run_write(loader: STM8Bootloader, args: argparse.Namespace):
+    """--write: write a file or hex string"""
+    addr, source = args.write
+    data = _load_write_source(source)
+    if loader.write_memory(addr, data):
+        print(f"[INFO] Write successful: {len(data)} bytes to 0x{addr:04X}")
+
+
+def _run_exec(loader: STM8Bootloader, args: argparse.Namespace):
+    """--exec: run machine code in the boot2 rx buffer"""
+    machine_code = args.exec
+    if len(machine_code) > MAX_DATA_SIZE:
+        raise ValueError(f"Machine code too long (max {MAX_DATA_SIZE} bytes)")
+    if loader.exec_machine_code(0, machine_code):
+        print(f"[INFO] Exec {len(machine_code)} bytes")
+
+
+def _run_go(loader: STM8Bootloader, args: argparse.Namespace):
+    """--go: jump to an address"""
+    if loader.go_execute(args.go):
+        print(f"[INFO] Sent jump to 0x{args.go:04X} command")
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    """Build the command line parser"""
     parser = argparse.ArgumentParser(
         description='STM8 Bootloader interaction tool',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -990,9 +1216,9 @@ Examples:
                        help='Read memory: ADDR is start address, SIZE is read size')
     parser.add_argument('-w', '--write', nargs=2, metavar=('ADDR', 'FILE/HEX'),
                        help='Write memory: ADDR is start address, FILE/HEX is file or hex string')
-    parser.add_argument('-g', '--go', metavar='ADDR',
+    parser.add_argument('-g', '--go', type=_addr_arg, metavar='ADDR',
                        help='Jump to address for execution')
-    parser.add_argument('-x', '--exec', metavar='HEX',
+    parser.add_argument('-x', '--exec', type=_hex_arg, metavar='HEX',
                        help='Execute machine code')
 
     # Other options
@@ -1005,8 +1231,23 @@ Examples:
     parser.add_argument('-v', '--verbose', action='store_true',
                        help='Display detailed debug information including serial data hex dumps')
 
+    return parser
+
+
+def main():
+    parser = _build_parser()
     args = parser.parse_args()
 
+    # argparse applies one type to every nargs value, so the two-value options
+    # are converted here, still before the MCU is reset
+    for option, values, types in (('-r/--read', args.read, (_addr_arg, _int_arg)),
+                                  ('-w/--write', args.write, (_addr_arg, str))):
+        if values:
+            try:
+                values[:] = [convert(value) for convert, value in zip(types, values)]
+            except argparse.ArgumentTypeError as e:
+                parser.error(f"argument {option}: {e}")
+
     # List serial ports
     if args.list_ports:
         list_serial_ports()
@@ -1023,118 +1264,54 @@ Examples:
         # Handle boot2 file path
         boot2_file = args.boot2
 
-        # Create bootloader instance
-        loader = STM8Bootloader(args.port, verbose=args.verbose, 
-                               reset_pin=args.reset_pin, boot2_file=boot2_file)
-
-        # Open serial port
-        loader.open(baudrate=args.baudrate)
-
-        # Check if already in boot2
-        in_boot2 = loader.check_boot2()
-
-        # If not in boot2 and not skipping boot2 upload, must upload boot2
-        if not in_boot2 and not args.skip_boot2:
-            print("[INFO] Not in boot2 mode, starting boot2 program upload...")
-            if not loader.upload_boot2():
-                print("[ERROR] boot2 upload failed")
-                loader.close()
-                return 1
-            print("[INFO] boot2 upload successful")
-        elif args.skip_boot2 and not in_boot2:
-            print("[WARNING] Skipping boot2 upload, but not in boot2 mode")
-            print("[INFO] Please use 'reload' command in interactive mode to upload boot2")
-
-        # Execute command line specified operations
-        command_executed = False
-
-        if args.read:
-            command_executed = True
-            try:
-                addr = int(args.read[0], 0)
-                size = int(args.read[1], 0)
-
-                data = loader.read_memory(addr, size)
-
-                # Print data
-                loader.print_hex_dump(addr, data)
-
-                # Save to file (if specified)
-                if args.output:
-                    with open(args.output, 'wb') as f:
-                        f.write(data)
-                    print(f"[INFO] Data saved to {args.output}")
-
-            except Exception as e:
-                print(f"[ERROR] Read failed: {e}")
-                loader.close()
-                return 1
-
-        if args.write:
-            command_executed = True
-            try:
-                addr = int(args.write[0], 0)
-                source = args.write[1]
-
-                # Determine if it's a file or hex string
-                if os.path.exists(source):
-                    # Read from file
-                    with open(source, 'rb') as f:
-                        data = f.read()
-                else:
-                    # Try to parse as hex string
-                    source = source.replace('0x', '').replace(' ', '')
-                    if len(source) % 2 != 0:
-                        raise ValueError("Hex string length must be even")
-                    data = bytes.fromhex(source)
-
-                if loader.write_memory(addr, data):
-                    print(f"[INFO] Write successful: {len(data)} bytes to 0x{addr:04X}")
-
-            except Exception as e:
-                print(f"[ERROR] Write failed: {e}")
-                loader.close()
-                return 1
-
-        if args.exec:
-            command_executed = True
-            try:
-                addr = 0
-                hex_str = args.exec.replace('0x', '').replace(' ', '')
-                if len(hex_str) % 2 != 0:
-                    raise ValueError("Hex string length must be even")
-                machine_code = bytes.fromhex(hex_str)
-                if len(machine_code) > MAX_DATA_SIZE:
-                    raise ValueError("Machine code too long (max {MAX_DATA_SIZE} bytes)")
-                if loader.exec_machine_code(addr, machine_code):
-                    print(f"[INFO] Exec {len(machine_code)} bytes")
-            except Exception as e:
-                print(f"[ERROR] Exec failed: {e}")
-                loader.close()
-                return 1
-
-        if args.go:
-            command_executed = True
-            try:
-                addr = int(args.go, 0)
-                if loader.go_execute(addr):
-                    print(f"[INFO] Sent jump to 0x{addr:04X} command")
-            except Exception as e:
-                print(f"[ERROR] Jump failed: {e}")
-                loader.close()
-                return 1
+        # Create bootloader instance, the port is closed on every way out
+        with STM8Bootloader(args.port, verbose=args.verbose,
+                            reset_pin=args.reset_pin, boot2_file=boot2_file) as loader:
+            # Open serial port
+            loader.open(baudrate=args.baudrate)
+
+            # Check if already in boot2
+            in_boot2 = loader.check_boot2()
+
+            # If not in boot2 and not skipping boot2 upload, must upload boot2
+            if not in_boot2 and not args.skip_boot2:
+                print("[INFO] Not in boot2 mode, starting boot2 program upload...")
+                if not loader.upload_boot2():
+                    print("[ERROR] boot2 upload failed")
+                    return 1
+                print("[INFO] boot2 upload successful")
+            elif args.skip_boot2 and not in_boot2:
+                print("[WARNING] Skipping boot2 upload, but not in boot2 mode")
+                print("[INFO] Please use 'reload' command in interactive mode to upload boot2")
+
+            # Execute command line specified operations, in a fixed order
+            operations = (
+                (args.read is not None, "Read", _run_read),
+                (args.write is not None, "Write", _run_write),
+                (bool(args.exec), "Exec", _run_exec),
+                (args.go is not None, "Jump", _run_go),
+            )
+            command_executed = False
 
-        # If no command specified or need to enter interactive mode
-        if not command_executed or args.interactive:
-            loader.interactive_mode()
+            for requested, label, run in operations:
+                if not requested:
+                    continue
+                command_executed = True
+                try:
+                    run(loader, args)
+                except Exception as e:
+                    print(f"[ERROR] {label} failed: {e}")
+                    return 1
 
-        # Close serial port
-        loader.close()
+            # If no command specified or need to enter interactive mode
+            if not command_executed or args.interactive:
+                loader.interactive_mode()
 
     except KeyboardInterrupt:
         print("\n[INFO] Program interrupted by user")
         return 1
-    except Exception as e:
+    except (STM8BootloaderError, serial.SerialException, OSError, ValueError) as e:
+        # Expected failures get a one-line message, anything else is a bug and keeps its traceback
         print(f"[ERROR] Error: {e}")
         return 1
 